@@ -1,18 +1,46 @@
+import codecs
 import csv
 import io
+import json
 import logging
+import os
 import re
 import hashlib
-from dataclasses import dataclass, asdict, field
+import itertools
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple, DefaultDict
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
+from operator import attrgetter
+from urllib.parse import urljoin
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, DefaultDict
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from company_filter_pennywatch import is_approved_company
+except ImportError:  # optional extra filter; the whitelist below still applies
+    def is_approved_company(issuer_name: Optional[str], issuer_isin: Optional[str] = None) -> bool:
+        return True
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = etree = None
 
 AFM_SHORTPOS_URL = "https://www.afm.nl/nl-nl/sector/registers/meldingenregisters/netto-shortposities-actueel"
 
+HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; PennywatchScraper/1.0)"}
+TIMEOUT = 30
+RETRIES = 3
+
+# validators + last parsed result, so an unchanged export is answered by a 304
+CACHE_DIR = os.path.expanduser(os.getenv("AFM_CACHE_DIR", "~/.cache/afm_scraper"))
+
 logger = logging.getLogger(__name__)
 if not logger.handlers:
     h = logging.StreamHandler()
@@ -20,6 +48,22 @@ if not logger.handlers:
     logger.addHandler(h)
 logger.setLevel(logging.INFO)
 
+# one pooled keep-alive session for all afm.nl requests (page + CSV)
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[403, 429, 500, 502, 503, 504],
+        ),
+    ),
+)
+
 # ---------------- Whitelist (exact names) ----------------
 WHITELIST = {
     "Koninklijke BAM Groep N.V.",
@@ -85,9 +129,22 @@ COL_PCT    = "Netto Shortpositie"        # numeric, no % sign
 COL_DATE   = "Positiedatum"              # e.g. 2025-11-07 00:00:00
 
 DATE_RE = re.compile(r"(\d{4})[-/](\d{2})[-/](\d{2})|(\d{2})[-/](\d{2})[-/](\d{4})")
-
-
-@dataclass
+# the exact shapes the strptime formats below accept; ranges are checked in _parse_date
+DATE_FULL_RE = re.compile(
+    r"(?:(?P<y1>[1-9]\d{3})-(?P<m1>\d{1,2})-(?P<d1>\d{1,2})"
+    r"(?: (?P<hh>\d{1,2}):(?P<mm>\d{1,2}):(?P<ss>\d{1,2}))?"
+    r"|(?P<d2>\d{1,2})(?P<sep>[-/])(?P<m2>\d{1,2})(?P=sep)(?P<y2>[1-9]\d{3}))$",
+    re.ASCII,
+)
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y")
+_MONTH_DAYS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+WS_RE   = re.compile(r"\s+")
+NUM_RE  = re.compile(r"(\d+(?:\.\d+)?)")
+PCT_TABLE = str.maketrans({"%": None, ",": "."})  # one pass instead of two .replace()
+CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+
+
+@dataclass(slots=True)
 class ShortPosition:
     issuer: str
     issuer_isin: Optional[str]
@@ -109,7 +166,23 @@ class ShortPosition:
     history: List[Dict] = field(default_factory=list)
 
     def to_dict(self) -> Dict:
-        d = asdict(self)
+        # explicit literal: asdict() deep-copies recursively, which flat fields don't need
+        d = {
+            "issuer": self.issuer,
+            "issuer_isin": self.issuer_isin,
+            "short_seller": self.short_seller,
+            "net_short_pct": self.net_short_pct,
+            "net_short_pct_num": self.net_short_pct_num,
+            "position_date": self.position_date,
+            "position_date_iso": self.position_date_iso,
+            "source_url": self.source_url,
+            "unique_id": self.unique_id,
+            "prev_net_short_pct": self.prev_net_short_pct,
+            "prev_net_short_pct_num": self.prev_net_short_pct_num,
+            "prev_position_date_iso": self.prev_position_date_iso,
+            "direction": self.direction,
+            "history": [dict(h) for h in self.history],  # callers get their own entries
+        }
         # legacy aliases so old code NEVER skips and can tag/dedupe
         d["melder"] = self.short_seller
         d["emittent"] = self.issuer
@@ -117,26 +190,19 @@ class ShortPosition:
         d["kapitaalbelang"] = self.net_short_pct_num
         d["kapitaalbelang_str"] = self.net_short_pct or f"{self.net_short_pct_num:.2f}%"
         d["meldingstype"] = "shortpositie"
-
-        # expose "previous" info & history
-        if self.prev_net_short_pct_num is not None:
-            d["prev_net_short_pct_num"] = self.prev_net_short_pct_num
-            d["prev_net_short_pct"] = self.prev_net_short_pct
-            d["prev_position_date_iso"] = self.prev_position_date_iso
-            d["direction"] = self.direction
-        if self.history:
-            d["history"] = self.history
         return d
 
 
 # ---------- helpers ----------
 
+@lru_cache(maxsize=4096)  # issuer / holder cells repeat across most of the register
 def _clean(x: str) -> str:
-    return re.sub(r"\s+", " ", (x or "").strip())
+    return WS_RE.sub(" ", (x or "").strip())
 
+@lru_cache(maxsize=4096)
 def _pct_to_float(p: str) -> float:
-    s = str(p or "").replace("%", "").replace(",", ".").strip()
-    m = re.search(r"(\d+(?:\.\d+)?)", s)
+    s = str(p or "").translate(PCT_TABLE).strip()
+    m = NUM_RE.search(s)
     return float(m.group(1)) if m else 0.0
 
 def _pct_to_str_two(num: float, fallback: str = "") -> str:
@@ -151,9 +217,29 @@ def _pct_to_str_two(num: float, fallback: str = "") -> str:
     s = s.replace(".", ",")
     return s if s.endswith("%") else s + "%"
 
+def _valid_ymd(y: int, m: int, d: int) -> bool:
+    if not 1 <= m <= 12 or not 1 <= d <= _MONTH_DAYS[m - 1]:
+        return False
+    return m != 2 or d < 29 or (y % 4 == 0 and (y % 100 != 0 or y % 400 == 0))
+
+@lru_cache(maxsize=4096)
 def _parse_date(d: str) -> Tuple[str, str]:
     raw = _clean(d)
-    for fmt in ("%Y-%m-%d %H:%M:%S", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y"):
+    # fast path: a whole, valid yyyy-mm-dd / dd-mm-yyyy value needs no strptime exceptions
+    m = DATE_FULL_RE.match(raw)
+    if m:
+        if m.group("y1"):
+            y, mo, dd = m.group("y1"), int(m.group("m1")), int(m.group("d1"))
+            time_ok = not m.group("hh") or (
+                int(m.group("hh")) <= 23 and int(m.group("mm")) <= 59 and int(m.group("ss")) <= 61
+            )
+        else:
+            y, mo, dd = m.group("y2"), int(m.group("m2")), int(m.group("d2"))
+            time_ok = True
+        if time_ok and _valid_ymd(int(y), mo, dd):
+            return raw, f"{y}-{mo:02d}-{dd:02d}"
+    # anything else (invalid dates, odd spacing, ...) behaves exactly as before
+    for fmt in DATE_FORMATS:
         try:
             return raw, datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
         except ValueError:
@@ -170,100 +256,234 @@ def _uid(issuer: str, short_seller: str, iso_date: str, pct: str) -> str:
     base = f"{issuer}|{short_seller}|{iso_date}|{pct}"
     return hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
 
-def _abs_url(href: str) -> str:
-    return href if not href.startswith("/") else "https://www.afm.nl" + href
-
-def _decode_best(content: bytes) -> str:
-    for enc in ("utf-8", "utf-16", "cp1252", "latin-1"):
+def _abs_url(href: str, base: str = "https://www.afm.nl") -> Optional[str]:
+    # empty / in-page (#...) hrefs are not links to a file; urljoin would turn them into the page itself
+    if not href.strip() or href.lstrip().startswith("#"):
+        return None
+    # plain concat for the usual absolute / root-relative links; urljoin only for the rest
+    if href.startswith(("http://", "https://")):
+        return href
+    if href.startswith("//"):
+        return "https:" + href
+    if href.startswith("/"):
+        return base + href
+    return urljoin(AFM_SHORTPOS_URL, href)
+
+def _cp1252_fallback(err: UnicodeDecodeError) -> Tuple[str, int]:
+    # bytes that aren't valid utf-8 are read as cp1252 (the old decode fallback)
+    return err.object[err.start:err.end].decode("cp1252", errors="replace"), err.end
+
+codecs.register_error("cp1252-fallback", _cp1252_fallback)
+
+def _sniff_encoding(head: bytes, content_type: str = "") -> str:
+    """
+    Pick the CSV encoding in O(1) from the BOM or the HTTP charset; default utf-8.
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    m = CHARSET_RE.search(content_type or "")
+    if m and m.group(1).lower() not in ("utf-8", "utf8"):
         try:
-            return content.decode(enc)
-        except Exception:
-            continue
-    return content.decode("utf-8", errors="ignore")
+            return codecs.lookup(m.group(1)).name
+        except LookupError:
+            logger.warning("Unknown CSV charset %r; decoding as utf-8.", m.group(1))
+    return "utf-8"
+
+def _csv_stream(resp: requests.Response) -> io.TextIOWrapper:
+    """
+    Decode the streamed CSV body on the fly instead of buffering it whole.
+    """
+    resp.raw.decode_content = True  # let urllib3 undo gzip/deflate
+    resp.raw.auto_close = False     # BufferedReader must see EOF, not a closed file
+    raw = io.BufferedReader(resp.raw, buffer_size=64 * 1024)
+    enc = _sniff_encoding(raw.peek(4)[:4], resp.headers.get("Content-Type", ""))
+    return io.TextIOWrapper(raw, encoding=enc, errors="cp1252-fallback", newline="")
 
 def _sniff_delimiter(text: str) -> str:
-    try:
-        return csv.Sniffer().sniff(text[:4096], delimiters=";,\t").delimiter
-    except Exception:
+    # the header line alone tells ; from , from tab; csv.Sniffer is far slower
+    head = text[:4096].split("\n", 1)[0]
+    if not head:
         return ";"
+    return max((";", ",", "\t"), key=head.count)
+
+
+def _col_index(header: List[str], name: str) -> int:
+    return header.index(name) if name in header else -1
+
+def _cell(row: List[str], i: int) -> str:
+    return row[i] if 0 <= i < len(row) else ""
 
 
 # ---------- discover CSV link ----------
 
+_UPPER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_LOWER = "abcdefghijklmnopqrstuvwxyz"
+_HREF_L = f"translate(@href, '{_UPPER}', '{_LOWER}')"
+_LABEL_L = f"translate(string(.), '{_UPPER}', '{_LOWER}')"
+# skip empty and in-page (#...) hrefs, which _abs_url rejects anyway
+_HREF_OK = "normalize-space(@href) != '' and not(starts-with(normalize-space(@href), '#'))"
+
+if etree is not None:
+    # evaluated inside libxml2; both return hrefs in document order
+    _CSV_HREF_XP = etree.XPath(
+        f"//a[{_HREF_OK}][contains({_HREF_L}, '.csv') or contains({_LABEL_L}, 'csv')"
+        f" or contains({_LABEL_L}, 'download')]/@href"
+    )
+    _EXPORT_HREF_XP = etree.XPath(
+        f"//a[{_HREF_OK}][contains({_HREF_L}, 'export.aspx') and contains({_HREF_L}, 'format=csv')]/@href"
+    )
+
+def _csv_hrefs_lxml(content: bytes) -> Tuple[Optional[str], Optional[str]]:
+    try:
+        doc = lxml.html.fromstring(content)
+    except (etree.ParserError, ValueError):
+        return None, None
+    primary = _CSV_HREF_XP(doc)
+    if primary:
+        return str(primary[0]), None
+    fallback = _EXPORT_HREF_XP(doc)
+    return None, (str(fallback[0]) if fallback else None)
+
+def _csv_hrefs_soup(text: str) -> Tuple[Optional[str], Optional[str]]:
+    # only reached without lxml, so don't pay the bs4 import on every run
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # only <a href> tags are inspected, so don't build the rest of the tree
+    soup = BeautifulSoup(text, "html.parser", parse_only=SoupStrainer("a", href=True))
+
+    # single pass: a CSV/download link wins outright, an export.aspx link is the fallback
+    fallback: Optional[str] = None
+    for a in soup.find_all("a"):
+        href = a["href"]
+        if not href.strip() or href.lstrip().startswith("#"):
+            continue
+        href_l = href.lower()
+        label = _clean(a.get_text()).lower()
+        if ".csv" in href_l or "csv" in label or "download" in label:
+            return href, None
+        if fallback is None and "export.aspx" in href_l and "format=csv" in href_l:
+            fallback = href
+    return None, fallback
+
 def _find_csv_url() -> Optional[str]:
     logger.info("Fetching AFM page: %s", AFM_SHORTPOS_URL)
-    r = requests.get(
-        AFM_SHORTPOS_URL,
-        timeout=30,
-        headers={"User-Agent": "Mozilla/5.0 (compatible; PennywatchScraper/1.0)"},
+    page = _read_cache(_PAGE_FILE)
+    # a link resolved by other link-discovery code or for another page must be looked up again
+    usable = (
+        isinstance(page, dict) and page.get("csv_url")
+        and page.get("page_url") == AFM_SHORTPOS_URL and page.get("version") == CACHE_VERSION
     )
+    page = page if usable else {}
+    r = _SESSION.get(AFM_SHORTPOS_URL, timeout=TIMEOUT, headers=_validators(page))
+    if r.status_code == 304 and page:
+        logger.info("AFM page not modified; reusing CSV link: %s", page["csv_url"])
+        return page["csv_url"]
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
 
-    for a in soup.find_all("a", href=True):
-        href = a["href"]
-        label = _clean(a.get_text()).lower()
-        if ".csv" in href.lower() or "csv" in label or "download" in label:
-            url = _abs_url(href)
-            logger.info("Found CSV link: %s", url)
-            return url
+    if etree is not None:
+        primary, fallback = _csv_hrefs_lxml(r.content)
+    else:
+        primary, fallback = _csv_hrefs_soup(r.text)
 
-    for a in soup.find_all("a", href=True):
-        href = a["href"].lower()
-        if "export.aspx" in href and "format=csv" in href:
-            url = _abs_url(a["href"])
-            logger.info("Found export link: %s", url)
-            return url
+    url = _abs_url(primary or fallback or "")
+    if not url:
+        logger.warning("No CSV link found on AFM page.")
+        return None
+    logger.info("Found CSV link: %s" if primary else "Found export link: %s", url)
 
-    logger.warning("No CSV link found on AFM page.")
-    return None
+    if r.headers.get("ETag") or r.headers.get("Last-Modified"):
+        _write_cache(_PAGE_FILE, {
+            "page_url": AFM_SHORTPOS_URL,
+            "version": CACHE_VERSION,
+            "csv_url": url,
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        })
+    return url
 
 
 # ---------- parsing & grouping ----------
 
-def _parse_csv_rows(text: str) -> List[ShortPosition]:
-    delim = _sniff_delimiter(text)
-    reader = csv.DictReader(io.StringIO(text), delimiter=delim)
-
-    rows: List[ShortPosition] = []
+def _parse_csv_rows(stream: io.TextIOBase) -> Iterator[ShortPosition]:
+    # sniff on the first ~4KB (completed to a full line), then keep streaming
+    head = stream.read(4096)
+    head += stream.readline()
+    delim = _sniff_delimiter(head)
+    reader = csv.reader(itertools.chain(io.StringIO(head), stream), delimiter=delim)
+
+    # resolve column positions once from the header row
+    header = next(reader, [])
+    i_issuer = _col_index(header, COL_ISSUER)
+    i_holder = _col_index(header, COL_HOLDER)
+    i_isin   = _col_index(header, COL_ISIN)
+    i_pct    = _col_index(header, COL_PCT)
+    i_date   = _col_index(header, COL_DATE)
+
+    # (issuer, holder) -> {(iso, pct): record}, pairs in first-seen order. Buffered so a
+    # repeated filing can replace the earlier one without changing the grouping order.
+    kept: Dict[Tuple[str, str], Dict[Tuple[str, str], ShortPosition]] = {}
     seen = 0
+    # locals for the per-row path, which every row goes through
+    clean, cell, whitelist = _clean, _cell, WHITELIST
+    # share one str object per distinct issuer/holder/isin across all kept rows
+    pool: Dict[str, str] = {}
+    intern = pool.setdefault
     for row in reader:
-        seen += 1
-        issuer = _clean(row.get(COL_ISSUER, ""))
-        holder = _clean(row.get(COL_HOLDER, ""))
-        isin   = _clean(row.get(COL_ISIN, "")) or None
-        pct_raw = _clean(str(row.get(COL_PCT, "")))
-        date_raw = _clean(str(row.get(COL_DATE, "")))
-        if not issuer or not holder or not pct_raw:
+        if not row:
             continue
+        seen += 1
+        issuer = clean(cell(row, i_issuer))
 
         # ---------------- Whitelist filter ----------------
-        if issuer not in WHITELIST:
+        # most of the register is dropped here, so check it before touching other cells
+        if not issuer or issuer not in whitelist:
+            continue
+
+        holder = clean(cell(row, i_holder))
+        pct_raw = clean(cell(row, i_pct))
+        if not holder or not pct_raw:
+            continue
+        isin   = clean(cell(row, i_isin)) or None
+        if not is_approved_company(issuer, isin):
             continue
+        issuer, holder = intern(issuer, issuer), intern(holder, holder)
+        if isin:
+            isin = intern(isin, isin)
+        date_raw = clean(cell(row, i_date))
 
         pct_num = _pct_to_float(pct_raw)
         date_raw, iso = _parse_date(date_raw)
-        uid = _uid(issuer, holder, iso, pct_raw)
-
-        rows.append(
-            ShortPosition(
-                issuer=issuer,
-                issuer_isin=isin,
-                short_seller=holder,
-                net_short_pct=_pct_to_str_two(pct_num, pct_raw),
-                net_short_pct_num=pct_num,
-                position_date=date_raw,
-                position_date_iso=iso,
-                source_url=AFM_SHORTPOS_URL,
-                unique_id=uid,
-            )
+
+        # AFM repeats filings; a repeat has the same uid but may differ in ISIN or raw date text.
+        # The last occurrence wins and moves to the end of its pair, as the old stable sort kept it.
+        filings = kept.setdefault((issuer, holder), {})
+        prev = filings.pop((iso, pct_raw), None)
+        uid = prev.unique_id if prev else _uid(issuer, holder, iso, pct_raw)
+
+        filings[(iso, pct_raw)] = ShortPosition(
+            issuer=issuer,
+            issuer_isin=isin,
+            short_seller=holder,
+            net_short_pct=_pct_to_str_two(pct_num, pct_raw),
+            net_short_pct_num=pct_num,
+            position_date=date_raw,
+            position_date_iso=iso,
+            source_url=AFM_SHORTPOS_URL,
+            unique_id=uid,
         )
 
-    logger.info("Parsed CSV rows: seen=%d, kept=%d (after whitelist)", seen, len(rows))
-    return rows
+    logger.info(
+        "Parsed CSV rows: seen=%d, kept=%d (after whitelist)", seen, sum(map(len, kept.values()))
+    )
+    for filings in kept.values():
+        yield from filings.values()
+
 
+_BY_DATE_PCT = attrgetter("position_date_iso", "net_short_pct_num")
 
-def _attach_previous(rows: List[ShortPosition]) -> List[ShortPosition]:
+def _attach_previous(rows: Iterable[ShortPosition]) -> List[ShortPosition]:
     """
     For each (issuer, short_seller) group, sort by date and keep only the latest item,
     but attach the most recent previous position (if any) to that latest item.
@@ -274,60 +494,165 @@ def _attach_previous(rows: List[ShortPosition]) -> List[ShortPosition]:
         groups[(sp.issuer, sp.short_seller)].append(sp)
 
     output: List[ShortPosition] = []
-    for key, items in groups.items():
-        # sort by date ascending (older -> newer)
-        items.sort(key=lambda x: (x.position_date_iso or "", x.net_short_pct_num or 0.0))
+    for items in groups.values():
+        if len(items) == 1:  # most pairs have a single filing: nothing to sort or attach
+            output.append(items[0])
+            continue
+
+        # sort by date ascending (older -> newer); both fields are always set by the parser
+        items.sort(key=_BY_DATE_PCT)
         latest = items[-1]
-        prev_items = items[:-1]
-
-        if prev_items:
-            prev = prev_items[-1]
-            latest.prev_net_short_pct_num = prev.net_short_pct_num
-            latest.prev_net_short_pct = prev.net_short_pct
-            latest.prev_position_date_iso = prev.position_date_iso
-            if latest.net_short_pct_num > prev.net_short_pct_num:
-                latest.direction = "up"
-            elif latest.net_short_pct_num < prev.net_short_pct_num:
-                latest.direction = "down"
-            else:
-                latest.direction = None
-
-            # Build history table: most recent first, limit 10
-            prev_items_sorted_desc = sorted(
-                prev_items, key=lambda x: (x.position_date_iso or "", x.net_short_pct_num or 0.0), reverse=True
-            )
-            history = []
-            for sp in prev_items_sorted_desc[:10]:
-                history.append({
-                    "date": sp.position_date_iso,
-                    "pct_num": sp.net_short_pct_num,
-                    "pct": sp.net_short_pct,  # already two decimals with comma
-                })
-            latest.history = history
+        prev = items[-2]
+        latest.prev_net_short_pct_num = prev.net_short_pct_num
+        latest.prev_net_short_pct = prev.net_short_pct
+        latest.prev_position_date_iso = prev.position_date_iso
+        if latest.net_short_pct_num > prev.net_short_pct_num:
+            latest.direction = "up"
+        elif latest.net_short_pct_num < prev.net_short_pct_num:
+            latest.direction = "down"
+        else:
+            latest.direction = None
+
+        # Build history table: most recent first, limit 10 (reuse the ascending sort)
+        history = []
+        for sp in reversed(items[-11:-1]):
+            history.append({
+                "date": sp.position_date_iso,
+                "pct_num": sp.net_short_pct_num,
+                "pct": sp.net_short_pct,  # already two decimals with comma
+            })
+        latest.history = history
 
         output.append(latest)
 
     return output
 
 
+# ---------- conditional GET cache ----------
+
+_STATE_FILE = "state.json"
+_RESULTS_FILE = "results.json"
+_PAGE_FILE = "page.json"
+# bump whenever link discovery or parsing/grouping output changes, so a 304 can't serve
+# a link or results built by older code
+CACHE_VERSION = 4
+
+def _cache_fingerprint() -> str:
+    # cached results are only valid for the same code version and whitelist / company filter settings
+    env = sorted((k, v) for k, v in os.environ.items() if k.startswith("SHORTPOS_"))
+    base = repr((CACHE_VERSION, sorted(WHITELIST), env))
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()[:16]
+
+def _read_cache(name: str):
+    try:
+        with open(os.path.join(CACHE_DIR, name), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_cache(name: str, data) -> None:
+    path = os.path.join(CACHE_DIR, name)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.warning("Could not write scrape cache %s: %s", path, e)
+
+def _validators(state: Dict) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+    return headers
+
+def _cached_positions(csv_url: str) -> Tuple[Dict[str, str], Optional[List[ShortPosition]]]:
+    """
+    Return (conditional request headers, cached positions) for csv_url,
+    or ({}, None) when there is no usable cache.
+    """
+    state = _read_cache(_STATE_FILE)
+    if not isinstance(state, dict):
+        return {}, None
+    if state.get("csv_url") != csv_url or state.get("fingerprint") != _cache_fingerprint():
+        return {}, None
+
+    headers = _validators(state)
+    if not headers:
+        return {}, None
+
+    data = _read_cache(_RESULTS_FILE)
+    try:
+        return headers, [ShortPosition(**d) for d in data]
+    except TypeError:
+        return {}, None
+
+def _last_csv_url() -> Optional[str]:
+    state = _read_cache(_STATE_FILE)
+    return state.get("csv_url") if isinstance(state, dict) else None
+
+def _store_positions(csv_url: str, resp: requests.Response, positions: List[ShortPosition]) -> None:
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    # results first, so the state file never points at results it doesn't describe
+    _write_cache(_RESULTS_FILE, [{f.name: getattr(sp, f.name) for f in fields(sp)} for sp in positions])
+    _write_cache(_STATE_FILE, {
+        "csv_url": csv_url,
+        "fingerprint": _cache_fingerprint(),
+        "etag": etag,
+        "last_modified": last_modified,
+    })
+
+
 # ---------- public scrape ----------
 
+def _open_csv(csv_url: str) -> Tuple[requests.Response, Optional[List[ShortPosition]]]:
+    cond_headers, cached = _cached_positions(csv_url)
+    resp = _SESSION.get(csv_url, timeout=TIMEOUT, stream=True, headers=cond_headers)
+    return resp, cached
+
 def scrape_short_positions() -> List[ShortPosition]:
-    csv_url = _find_csv_url()
+    guess = _last_csv_url()
+    speculative: Optional[Tuple[requests.Response, Optional[List[ShortPosition]]]] = None
+    if guess:
+        # the CSV link rarely moves: request the page and the last known CSV concurrently
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            f_csv = ex.submit(_open_csv, guess)
+            f_url = ex.submit(_find_csv_url)
+        try:
+            speculative = f_csv.result()
+        except requests.RequestException as e:
+            logger.info("Speculative CSV fetch failed (%s); using the page link.", e)
+        try:
+            csv_url = f_url.result()
+        except Exception:
+            if speculative:
+                speculative[0].close()
+            raise
+    else:
+        csv_url = _find_csv_url()
+
+    if speculative and csv_url != guess:
+        speculative[0].close()
+        speculative = None
     if not csv_url:
         logger.warning("AFM short positions: found 0 items (no CSV link).")
         return []
 
-    resp = requests.get(
-        csv_url,
-        timeout=30,
-        headers={"User-Agent": "Mozilla/5.0 (compatible; PennywatchScraper/1.0)"},
-    )
-    resp.raise_for_status()
-    text = _decode_best(resp.content)
+    resp, cached = speculative or _open_csv(csv_url)
+    with resp:
+        if resp.status_code == 304 and cached is not None:
+            logger.info("AFM CSV not modified; reusing %d cached positions.", len(cached))
+            return cached
+        resp.raise_for_status()
+        # rows are parsed lazily, so group them while the stream is still open
+        latest_with_prev = _attach_previous(_parse_csv_rows(_csv_stream(resp)))
 
-    all_rows = _parse_csv_rows(text)
-    latest_with_prev = _attach_previous(all_rows)
+    _store_positions(csv_url, resp, latest_with_prev)
     return latest_with_prev
 
 
@@ -1,9 +1,27 @@
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Iterable, Iterator
 from datetime import datetime
+from functools import lru_cache
 
 AFM_SOURCE_LABEL = "klik hier"
 AFM_SOURCE_URL_FALLBACK = "https://www.afm.nl/nl-nl/sector/registers/meldingenregisters/netto-shortposities-actueel"
 
+# Record keys tried in order for each field (scraper names first, legacy aliases after)
+_RESOLVE = {
+    "issuer":       ("issuer", "emittent"),
+    "short_seller": ("short_seller", "melder"),
+    "date_iso":     ("position_date_iso", "position_date", "meldingsdatum"),
+}
+
+def _resolve(item: Dict) -> Dict[str, str]:
+    """
+    Resolve the aliased fields of a record once; missing/empty fields become "".
+    """
+    return {k: next((item[x] for x in keys if item.get(x)), "") for k, keys in _RESOLVE.items()}
+
+# HTML-escape table for register text placed in the title, excerpt and body (one pass per field)
+_HTML_ESC = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"})
+
+@lru_cache(maxsize=512)
 def _pct_nl(num: Optional[float], fallback: str = "") -> str:
     """
     Format percentage with Dutch comma separator (two decimals).
@@ -19,6 +37,7 @@ def _pct_nl(num: Optional[float], fallback: str = "") -> str:
     s = s.replace(".", ",")
     return s if s.endswith("%") else s + "%"
 
+@lru_cache(maxsize=1024)
 def _fmt_date_nl(iso: str | None) -> str:
     """
     Convert 'YYYY-MM-DD' to 'D-M-YYYY' (e.g., 2025-11-07 -> 7-11-2025).
@@ -52,7 +71,8 @@ def _nl_title(issuer: str, short_seller: str, pct_str_two: str, direction: Optio
     return f"{short_seller} meldt {pct_str_two} shortpositie in {issuer}."
 
 def _excerpt_nl(issuer: str, short_seller: str, pct_str: str, date_iso: str, prev_str: Optional[str], direction: Optional[str]) -> str:
-    dnl = _fmt_date_nl(date_iso)
+    # unparseable dates come back as the raw register cell, so escape like the other fields
+    dnl = _fmt_date_nl(date_iso).translate(_HTML_ESC)
     if prev_str:
         if direction == "up":
             trend = " Deze positie is verhoogd ten opzichte van de vorige melding."
@@ -69,6 +89,9 @@ def _excerpt_nl(issuer: str, short_seller: str, pct_str: str, date_iso: str, pre
         f"Gebaseerd op het actuele AFM-register{(' (datum: ' + dnl + ')') if dnl else ''}."
     )
 
+_HISTORY_TPL = '<table><thead><tr><th>Datum</th><th>Positie</th></tr></thead><tbody>\n{rows}\n</tbody></table>'
+_HISTORY_ROW = "<tr><td>{date}</td><td>{pct}</td></tr>"
+
 def _history_table(history: List[Dict]) -> str:
     """
     Build a simple HTML table with columns: Datum, Positie (max 10 rows).
@@ -76,24 +99,46 @@ def _history_table(history: List[Dict]) -> str:
     """
     if not history:
         return ""
-    rows = []
-    rows.append('<table><thead><tr><th>Datum</th><th>Positie</th></tr></thead><tbody>')
-    for h in history[:10]:
-        date_iso = h.get("date", "")
-        date_nl = _fmt_date_nl(date_iso)
-        pct  = h.get("pct") or _pct_nl(h.get("pct_num"))
-        rows.append(f"<tr><td>{date_nl}</td><td>{pct}</td></tr>")
-    rows.append("</tbody></table>")
-    return "\n".join(rows)
-
-def _content_nl(item: Dict) -> str:
-    issuer        = item.get("issuer") or item.get("emittent") or ""
+    esc = _HTML_ESC
+    rows = "\n".join(
+        _HISTORY_ROW.format(
+            date=_fmt_date_nl(h.get("date", "")).translate(esc),
+            pct=(h.get("pct") or _pct_nl(h.get("pct_num"))).translate(esc),
+        )
+        for h in history[:10]
+    )
+    return _HISTORY_TPL.format(rows=rows)
+
+# Article body; optional rows are rendered to "" (or a full line) before formatting
+_CONTENT_TPL = (
+    "<h3>Overzicht van shortpositie</h3>\n"
+    "<ul>\n"
+    "<li><strong>Aandeel:</strong> {issuer}</li>\n"
+    "<li><strong>Short seller:</strong> {short_seller}</li>\n"
+    "<li><strong>Positie:</strong> {position}</li>\n"
+    "{isin_row}{date_row}"
+    "</ul>\n"
+    "<h3>Eerdere meldingen</h3>\n"
+    "{history_block}\n"
+    "<h3>Disclaimer</h3>\n"
+    "<p><em>Deze publicatie is informatief en vormt geen beleggingsadvies. "
+    "De informatie op deze pagina is gebaseerd op het AFM-register voor nettoshortposities. "
+    "De publicaties van het register zijn openbaar en bereikbaar via de AFM-website: "
+    '<a href="{source_url}" target="_blank" rel="nofollow noopener">{source_label}</a>. '
+    "Pennywatch.nl is niet gelieerd aan de Autoriteit Financiële Markten (AFM). "
+    "Pennywatch.nl geeft geen garanties over de juistheid of volledigheid van de informatie.</em></p>"
+    "{uid_block}"
+)
+
+def _content_nl(item: Dict, r: Optional[Dict[str, str]] = None) -> str:
+    r             = r or _resolve(item)
+    issuer        = r["issuer"]
     isin          = item.get("issuer_isin") or ""
-    short_seller  = item.get("short_seller") or item.get("melder") or ""
+    short_seller  = r["short_seller"]
     pct_num       = item.get("net_short_pct_num")
     pct_raw       = item.get("net_short_pct") or ""
     pct_str       = _pct_nl(pct_num, pct_raw)
-    date_iso      = item.get("position_date_iso") or item.get("position_date") or item.get("meldingsdatum") or ""
+    date_iso      = r["date_iso"]
     date_nl       = _fmt_date_nl(date_iso)
     source_url    = item.get("source_url") or AFM_SOURCE_URL_FALLBACK
 
@@ -102,71 +147,68 @@ def _content_nl(item: Dict) -> str:
     prev_str      = _pct_nl(prev_num, prev_raw) if prev_num is not None else None
     history       = item.get("history") or []
 
-    parts: list[str] = []
-    parts.append("<h3>Overzicht van shortpositie</h3>")
-    parts.append("<ul>")
-    parts.append(f"<li><strong>Aandeel:</strong> {issuer}</li>")
-    parts.append(f"<li><strong>Short seller:</strong> {short_seller}</li>")
+    # percentages/dates fall back to the raw register text when unparseable, so escape them too
+    pct_html      = pct_str.translate(_HTML_ESC)
+    position      = f"{pct_html} (vorige: {prev_str.translate(_HTML_ESC)})" if prev_str else pct_html
     # Only one Meldingsdatum (requested)
-    if prev_str:
-        parts.append(f"<li><strong>Positie:</strong> {pct_str} (vorige: {prev_str})</li>")
-    else:
-        parts.append(f"<li><strong>Positie:</strong> {pct_str}</li>")
-    if isin:
-        parts.append(f"<li><strong>ISIN:</strong> {isin}</li>")
-    if date_nl:
-        parts.append(f"<li><strong>Meldingsdatum:</strong> {date_nl}</li>")
-    parts.append("</ul>")
-
-    # New section: Eerdere meldingen (with table)
-    parts.append("<h3>Eerdere meldingen</h3>")
-    table_html = _history_table(history)
-    if table_html:
-        parts.append(table_html)
-    else:
-        parts.append("<p>Geen eerdere meldingen gevonden.</p>")
-
-    parts.append("<h3>Disclaimer</h3>")
-    parts.append(
-        "<p><em>Deze publicatie is informatief en vormt geen beleggingsadvies. "
-        "De informatie op deze pagina is gebaseerd op het AFM-register voor nettoshortposities. "
-        "De publicaties van het register zijn openbaar en bereikbaar via de AFM-website: "
-        f'<a href="{source_url}" target="_blank" rel="nofollow noopener">{AFM_SOURCE_LABEL}</a>. '
-        "Pennywatch.nl is niet gelieerd aan de Autoriteit Financiële Markten (AFM). "
-        "Pennywatch.nl geeft geen garanties over de juistheid of volledigheid van de informatie.</em></p>"
-    )
+    isin_row      = f"<li><strong>ISIN:</strong> {isin.translate(_HTML_ESC)}</li>\n" if isin else ""
+    date_row      = f"<li><strong>Meldingsdatum:</strong> {date_nl.translate(_HTML_ESC)}</li>\n" if date_nl else ""
+    history_block = _history_table(history) or "<p>Geen eerdere meldingen gevonden.</p>"
 
     # Invisible unique marker (also added again by publisher before posting)
     uid = (item.get("unique_id") or item.get("afm_key") or "").strip()
-    if uid:
-        parts.append(f"<!--PW-AFM-UID:{uid}-->")
-        parts.append(f'<span style="display:none">PW-AFM-UID:{uid}</span>')
+    uid_block = (
+        f'\n<!--PW-AFM-UID:{uid}-->\n<span style="display:none">PW-AFM-UID:{uid}</span>'
+        if uid else ""
+    )
 
-    return "\n".join(parts)
+    return _CONTENT_TPL.format(
+        issuer=issuer.translate(_HTML_ESC),
+        short_seller=short_seller.translate(_HTML_ESC),
+        position=position,
+        isin_row=isin_row,
+        date_row=date_row,
+        history_block=history_block,
+        source_url=source_url,
+        source_label=AFM_SOURCE_LABEL,
+        uid_block=uid_block,
+    )
 
-def build_article(item: Dict, *, category_id: int | None = None) -> Dict:
-    issuer        = item.get("issuer") or item.get("emittent") or ""
-    short_seller  = item.get("short_seller") or item.get("melder") or ""
+@lru_cache(maxsize=2048)
+def _tags(issuer: str, short_seller: str) -> tuple:
+    # issuer first, then short seller; a single tag when both are the same
+    if issuer == short_seller:
+        return (issuer,) if issuer else ()
+    return tuple(t for t in (issuer, short_seller) if t)
+
+def _build_one(item: Dict, categories: Optional[List[int]]) -> Dict:
+    r             = _resolve(item)
+    issuer        = r["issuer"]
+    short_seller  = r["short_seller"]
     pct_num       = item.get("net_short_pct_num")
     pct_raw       = item.get("net_short_pct") or ""
     pct_str       = _pct_nl(pct_num, pct_raw)  # two decimals
-    date_iso      = item.get("position_date_iso") or item.get("position_date") or item.get("meldingsdatum") or ""
+    date_iso      = r["date_iso"]
 
     prev_num      = item.get("prev_net_short_pct_num")
     prev_raw      = item.get("prev_net_short_pct") or ""
     prev_str      = _pct_nl(prev_num, prev_raw) if prev_num is not None else None
     direction     = item.get("direction")
 
-    title   = _nl_title(issuer, short_seller, pct_str, direction)
-    excerpt = _excerpt_nl(issuer, short_seller, pct_str, date_iso, prev_str, direction)
-    content = _content_nl(item)
+    # title and excerpt are rendered as HTML by WordPress too; tags and meta keep the raw values
+    issuer_html, seller_html = issuer.translate(_HTML_ESC), short_seller.translate(_HTML_ESC)
+    pct_html  = pct_str.translate(_HTML_ESC)
+    prev_html = prev_str.translate(_HTML_ESC) if prev_str else prev_str
+    title   = _nl_title(issuer_html, seller_html, pct_html, direction)
+    excerpt = _excerpt_nl(issuer_html, seller_html, pct_html, date_iso, prev_html, direction)
+    content = _content_nl(item, r)
 
     payload: Dict = {
         "title": title,
         "excerpt": excerpt,
         "content": content,
         # Tags as names — publisher resolves/creates IDs
-        "tags": list(filter(None, {issuer, short_seller})),
+        "tags": list(_tags(issuer, short_seller)),
         "meta": {
             "afm_unique_id": item.get("unique_id") or item.get("afm_key"),
             "afm_date": _fmt_date_nl(date_iso),
@@ -175,9 +217,21 @@ def build_article(item: Dict, *, category_id: int | None = None) -> Dict:
             "direction": direction,
         },
     }
-    if category_id is not None:
-        payload["categories"] = [int(category_id)]
+    if categories is not None:
+        payload["categories"] = categories
     return payload
 
+def build_article(item: Dict, *, category_id: int | None = None) -> Dict:
+    return _build_one(item, [int(category_id)] if category_id is not None else None)
+
+def build_articles(items: Iterable[Dict], *, category_id: int | None = None) -> Iterator[Dict]:
+    """
+    Lazily build payloads for a stream of records. The categories list is built
+    once and shared by all payloads (they are only serialized to JSON).
+    """
+    categories = [int(category_id)] if category_id is not None else None
+    for item in items:
+        yield _build_one(item, categories)
+
 def build_post(item: Dict, *, category_id: int | None = None) -> Dict:
     return build_article(item, category_id=category_id)
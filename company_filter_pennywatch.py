@@ -1,4 +1,6 @@
 import os
+import re
+from functools import lru_cache
 
 USE_FILTER = os.getenv("SHORTPOS_USE_FILTER", "0").strip().lower() in {"1", "true", "yes"}
 
@@ -6,19 +8,29 @@ def _csv(envkey: str) -> set[str]:
     raw = os.getenv(envkey, "")
     return {x.strip() for x in raw.split(",") if x.strip()}
 
-ALLOW_ISINS   = {v.upper() for v in _csv("SHORTPOS_ALLOW_ISINS")}
-ALLOW_ISSUERS = {v.lower() for v in _csv("SHORTPOS_ALLOW_ISSUERS")}
-DENY_ISSUERS  = {v.lower() for v in _csv("SHORTPOS_DENY_ISSUERS")}
+ALLOW_ISINS   = frozenset(v.upper() for v in _csv("SHORTPOS_ALLOW_ISINS"))
+ALLOW_ISSUERS = frozenset(v.lower() for v in _csv("SHORTPOS_ALLOW_ISSUERS"))
+DENY_ISSUERS  = frozenset(v.lower() for v in _csv("SHORTPOS_DENY_ISSUERS"))
 
-def _has(hay: str, needles: set[str]) -> bool:
-    h = (hay or "").lower()
-    return any(n in h for n in needles)
+def _needles_re(needles: frozenset[str]) -> re.Pattern | None:
+    # one alternation so a substring check is a single C-level scan
+    if not needles:
+        return None
+    return re.compile("|".join(re.escape(n) for n in sorted(needles)))
 
+_ALLOW_ISSUERS_RE = _needles_re(ALLOW_ISSUERS)
+_DENY_ISSUERS_RE  = _needles_re(DENY_ISSUERS)
+
+def _has(hay: str, needles: re.Pattern | None) -> bool:
+    return bool(needles and needles.search((hay or "").lower()))
+
+# filter sets are fixed at import, so a verdict per (name, isin) never changes
+@lru_cache(maxsize=2048)
 def is_approved_company(issuer_name: str | None, issuer_isin: str | None = None) -> bool:
     if not USE_FILTER:
         return True
-    if issuer_name and _has(issuer_name, DENY_ISSUERS):
+    if issuer_name and _has(issuer_name, _DENY_ISSUERS_RE):
         return False
-    ok_name = True if not ALLOW_ISSUERS else _has(issuer_name or "", ALLOW_ISSUERS)
+    ok_name = True if not ALLOW_ISSUERS else _has(issuer_name or "", _ALLOW_ISSUERS_RE)
     ok_isin = True if not ALLOW_ISINS else (issuer_isin or "").upper() in ALLOW_ISINS
     return ok_name and ok_isin
@@ -4,7 +4,7 @@ import logging
 from typing import Dict, Tuple, Optional, List, Union
 
 import requests
-from article_builder import build_article
+from article_builder import build_articles
 
 WP_BASE_URL        = os.getenv("WP_BASE_URL", "").rstrip("/")
 WP_USERNAME        = os.getenv("WP_USERNAME")
@@ -233,12 +233,10 @@ def _post_to_wordpress(payload: Dict) -> Dict:
 
 def publish_items(items: List[Dict]) -> int:
     """Publish EVERYTHING (no skip logic), up to MAX_POSTS_PER_RUN."""
+    if MAX_POSTS_PER_RUN <= 0:
+        return 0
     created = 0
-    for item in items:
-        if created >= MAX_POSTS_PER_RUN:
-            break
-
-        payload = build_article(item, category_id=WP_CATEGORY_ID)
+    for payload in build_articles(items, category_id=WP_CATEGORY_ID):
         payload.setdefault("status", WP_PUBLISH_STATUS)  # publish
 
         try:
@@ -249,7 +247,10 @@ def publish_items(items: List[Dict]) -> int:
                 created += 1
                 time.sleep(0.3)
         except Exception as e:
-            logger.error("Failed to publish item (afm_key=%s): %s", item.get("afm_key") or item.get("unique_id"), e)
+            logger.error("Failed to publish item (afm_key=%s): %s", payload["meta"]["afm_unique_id"], e)
+        # checked after posting, so the generator never builds a payload past the limit
+        if created >= MAX_POSTS_PER_RUN:
+            break
     logger.info("Published %d items.", created)
     return created
 